@@ -2,7 +2,7 @@
 #
 # /// script
 # requires-python = ">=3.11"
-# dependencies = ["discord.py>=2.3,<3"]
+# dependencies = ["discord.py>=2.3,<3", "aiofiles>=23"]
 # ///
 
 """
@@ -20,18 +20,25 @@ Notes:
   - Date/times are treated in UTC. The date range is inclusive of the whole day(s).
   - Requires the bot to have "Read Message History" and "View Channel" on target channels.
   - Requires the "Message Content Intent" to be enabled in the Discord Developer Portal for the bot.
+  - Files are saved under discord-downloads/YYYY/MM/DD/ by the message's UTC creation date.
+  - Re-runs resume each channel after the last fully processed message when the range allows it.
 """
 
 import argparse
 import asyncio
 import hashlib
+import logging
+import logging.handlers
 import os
 import sqlite3
+import sys
 import warnings
 from pathlib import Path
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
+import aiofiles
+import aiohttp
 import discord
 
 # Suppress aiohttp unclosed connector warnings (common with discord.py)
@@ -39,7 +46,27 @@ warnings.filterwarnings("ignore", message="Unclosed connector", category=Resourc
 
 # ---------- Config ----------
 DOWNLOAD_DIR = Path("discord-downloads")
+SHARD_FORMAT = "%Y/%m/%d"  # files are sharded into per-day (UTC) subdirectories of DOWNLOAD_DIR
 DB_PATH = Path("discord-downloads.db")
+DOWNLOAD_CONCURRENCY = 8  # in-flight attachment downloads across all channels
+RATE_LIMIT_RETRIES = 3
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+COMMIT_EVERY = 50  # manifest inserts per transaction (also committed at the end of each channel)
+MEDIA_EXTS = frozenset(
+    {
+        # images
+        "jpg", "jpeg", "png", "gif", "webp", "bmp", "tiff", "heic",
+        # videos
+        "mp4", "mov", "m4v", "webm", "mkv", "avi",
+    }
+)
+
+# Per-file progress goes through a buffered handler so concurrent downloads don't contend on stdout
+log = logging.getLogger("download_discord_media")
+log.setLevel(logging.INFO)
+log.propagate = False
+log_buffer = logging.handlers.MemoryHandler(capacity=100, target=logging.StreamHandler(sys.stdout))
+log.addHandler(log_buffer)
 
 
 def parse_args():
@@ -60,55 +87,153 @@ def parse_date_utc(date_str: str) -> datetime:
 
 def compute_filename(author_id: int, created_at: datetime, attachment_id: int, original_name: str) -> str:
     """
-    Filename = sha256(f"{author_id}-{attachment_id}-{created_at_iso}")[:16] + original extension.
+    Filename = blake2b(f"{author_id}-{attachment_id}-{created_at_iso}", digest_size=8) + original extension.
     Including attachment_id avoids collisions when a single message has multiple attachments.
     """
     ext = Path(original_name).suffix.lower()  # keep original extension
     base = f"{author_id}-{attachment_id}-{created_at.astimezone(timezone.utc).isoformat()}"
-    digest = hashlib.sha256(base.encode("utf-8")).hexdigest()[:16]
+    digest = hashlib.blake2b(base.encode("utf-8"), digest_size=8).hexdigest()
     return f"{digest}{ext}" if ext else digest
 
 
+def list_existing_files(start_dt: datetime, end_dt: datetime) -> set[Path]:
+    """
+    Paths of files already present in the day shards covering [start_dt, end_dt].
+    One listing per shard replaces a stat() per attachment, and only the requested days are loaded.
+    """
+    existing = set()
+    day = start_dt.date()
+    while day <= end_dt.date():
+        shard = DOWNLOAD_DIR / day.strftime(SHARD_FORMAT)
+        if shard.is_dir():
+            existing.update(shard.iterdir())
+        day += timedelta(days=1)
+    return existing
+
+
 def is_media(attachment: discord.Attachment) -> bool:
     """
     Accept images/videos. Prefer content_type when available, else fallback to extension.
     """
     ct = (attachment.content_type or "").lower()
-    if ct.startswith("image/") or ct.startswith("video/"):
+    if ct.startswith(("image/", "video/")):
         return True
 
     # Fallback by extension
-    ext = Path(attachment.filename).suffix.lower()
-    image_exts = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp", ".tiff", ".heic"}
-    video_exts = {".mp4", ".mov", ".m4v", ".webm", ".mkv", ".avi"}
-    return ext in image_exts or ext in video_exts
+    _, dot, ext = attachment.filename.rpartition(".")
+    return bool(dot) and ext.lower() in MEDIA_EXTS
 
 
 # ---------- Manifest (SQLite) ----------
+def db_connect(**kwargs) -> sqlite3.Connection:
+    """Open a manifest connection with the per-connection PRAGMAs applied (every connection needs them)."""
+    conn = sqlite3.connect(DB_PATH, **kwargs)
+    # WAL + relaxed sync avoids an fsync per commit; WAL needs a real file (not ":memory:")
+    if str(DB_PATH) != ":memory:":
+        conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA temp_store=memory")
+    conn.execute("PRAGMA cache_size=-20000")
+    return conn
+
+
+DOWNLOADS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS downloads (
+        attachment_id TEXT PRIMARY KEY,
+        message_id TEXT NOT NULL,
+        channel_id TEXT NOT NULL,
+        guild_id TEXT NOT NULL,
+        url TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        created_at_utc INTEGER NOT NULL  -- UNIX epoch microseconds
+    )
+"""
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_epoch_us(dt: datetime) -> int:
+    """Exact UNIX epoch microseconds for an aware datetime (no float rounding)."""
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+
+def iso_to_epoch_us(value: str) -> int:
+    """Convert a legacy ISO-8601 created_at_utc value (naive means UTC) to epoch microseconds."""
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        raise SystemExit(f"Cannot migrate manifest: invalid created_at_utc {value!r} in {DB_PATH}.")
+    return to_epoch_us(dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc))
+
+
+def db_migrate_created_at(conn: sqlite3.Connection):
+    """
+    Older manifests stored created_at_utc as ISO-8601 text; rebuild 'downloads' with epoch microseconds.
+    The whole rebuild runs in one transaction (SQLite DDL is transactional), so an interruption
+    leaves the legacy table untouched.
+    """
+    columns = {name: decl for _, name, decl, *_ in conn.execute("PRAGMA table_info(downloads)")}
+    if columns.get("created_at_utc") != "TEXT":
+        return
+
+    conn.commit()  # an explicit BEGIN needs no transaction to be open
+    conn.execute("BEGIN")
+    try:
+        conn.execute("ALTER TABLE downloads RENAME TO downloads_old")
+        conn.execute(DOWNLOADS_SCHEMA)
+        rows = conn.execute(
+            "SELECT attachment_id, message_id, channel_id, guild_id, url, filename, created_at_utc FROM downloads_old"
+        ).fetchall()
+        conn.executemany(
+            "INSERT INTO downloads VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(*row[:6], iso_to_epoch_us(row[6])) for row in rows],
+        )
+        conn.execute("DROP TABLE downloads_old")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
 def db_init(conn: sqlite3.Connection):
+    db_migrate_created_at(conn)
+    conn.execute(DOWNLOADS_SCHEMA)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_dl_created ON downloads(created_at_utc)")
+    # Per-channel resume cursor: every message id in [scanned_from_id, last_message_id] has been processed
     conn.execute(
         """
-        CREATE TABLE IF NOT EXISTS downloads (
-            attachment_id TEXT PRIMARY KEY,
-            message_id TEXT NOT NULL,
-            channel_id TEXT NOT NULL,
-            guild_id TEXT NOT NULL,
-            url TEXT NOT NULL,
-            filename TEXT NOT NULL,
-            created_at_utc TEXT NOT NULL
+        CREATE TABLE IF NOT EXISTS channel_cursors (
+            channel_id TEXT PRIMARY KEY,
+            scanned_from_id TEXT NOT NULL,
+            last_message_id TEXT NOT NULL
         )
         """
     )
     conn.commit()
 
 
-def db_has_attachment(conn: sqlite3.Connection, attachment_id: int) -> bool:
-    cur = conn.execute("SELECT 1 FROM downloads WHERE attachment_id=?", (str(attachment_id),))
-    return cur.fetchone() is not None
+def db_attachment_ids(conn: sqlite3.Connection) -> set[str]:
+    """Load every recorded attachment_id once so the hot loop can skip SQLite lookups."""
+    return {row[0] for row in conn.execute("SELECT attachment_id FROM downloads")}
+
 
+def db_channel_cursors(conn: sqlite3.Connection) -> dict[int, tuple[int, int]]:
+    """Load every channel cursor as {channel_id: (scanned_from_id, last_message_id)}."""
+    rows = conn.execute("SELECT channel_id, scanned_from_id, last_message_id FROM channel_cursors")
+    return {int(ch): (int(first), int(last)) for ch, first, last in rows}
 
-def db_insert(
-    conn: sqlite3.Connection,
+
+def db_set_cursor(conn: sqlite3.Connection, *, channel_id: int, scanned_from_id: int, last_message_id: int):
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO channel_cursors (channel_id, scanned_from_id, last_message_id)
+        VALUES (?, ?, ?)
+        """,
+        (str(channel_id), str(scanned_from_id), str(last_message_id)),
+    )
+
+
+def manifest_row(
     *,
     attachment_id: int,
     message_id: int,
@@ -117,33 +242,108 @@ def db_insert(
     url: str,
     filename: str,
     created_at_utc: datetime,
-):
-    conn.execute(
+) -> tuple:
+    """Build a 'downloads' row in column order, ready for db_insert_many."""
+    return (
+        str(attachment_id),
+        str(message_id),
+        str(channel_id),
+        str(guild_id),
+        url,
+        filename,
+        to_epoch_us(created_at_utc),
+    )
+
+
+def db_insert_many(conn: sqlite3.Connection, rows: list[tuple]):
+    conn.executemany(
         """
         INSERT OR IGNORE INTO downloads
             (attachment_id, message_id, channel_id, guild_id, url, filename, created_at_utc)
         VALUES (?, ?, ?, ?, ?, ?, ?)
         """,
-        (
-            str(attachment_id),
-            str(message_id),
-            str(channel_id),
-            str(guild_id),
-            url,
-            filename,
-            created_at_utc.astimezone(timezone.utc).isoformat(),
-        ),
+        rows,
     )
-    conn.commit()
 
 
-async def bounded_history(channel: discord.TextChannel, *, after: Optional[datetime], before: Optional[datetime]):
+async def manifest_writer(conn: sqlite3.Connection, queue: asyncio.Queue):
+    """
+    Single writer for the manifest: drains items from 'queue' so only this task touches the connection.
+      ("row", manifest_row)  - buffered, flushed with executemany every COMMIT_EVERY rows
+      ("commit", cursor)     - end of a channel: flush, save the channel cursor (if any) and commit
+    SQLite calls run in a worker thread so a slow fsync never stalls in-flight downloads.
+    A failed flush is rolled back and its rows kept for the next flush; until a flush succeeds again no
+    cursor is saved, so a channel is never marked done past rows that were not committed.
+    """
+    pending: list[tuple] = []
+    failed = False
+
+    def flush(cursor: Optional[dict] = None):
+        nonlocal failed
+        try:
+            if pending:
+                db_insert_many(conn, pending)
+            if cursor and not failed:
+                db_set_cursor(conn, **cursor)
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            failed = True
+            raise
+        pending.clear()
+        failed = False
+
+    while True:
+        kind, payload = await queue.get()
+        try:
+            if kind == "row":
+                pending.append(payload)
+                if len(pending) >= COMMIT_EVERY:
+                    await asyncio.to_thread(flush)
+            else:
+                await asyncio.to_thread(flush, payload)
+        except sqlite3.Error as e:
+            # Keep draining; a dead writer would leave queue.join() waiting forever
+            log.error("   ERROR writing manifest: %s", e)
+        finally:
+            queue.task_done()
+
+
+def retry_after_seconds(value: Optional[str]) -> float:
+    """Seconds to wait from a Retry-After header; falls back to 1s if missing or not a number (e.g. an HTTP-date)."""
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return 1.0
+
+
+async def save_attachment(
+    session: aiohttp.ClientSession, sem: asyncio.Semaphore, att: discord.Attachment, dest: Path
+):
     """
-    Async generator over channel history between 'after' and 'before'.
-    discord.py history() uses exclusive bounds; we handle inclusivity at the call site.
+    Stream a single attachment to disk while holding a slot in 'sem'.
+    Uses the shared session so CDN connections (and TLS sessions) are reused; retries on HTTP 429.
+    Writes to '<dest>.part' and renames into place, so a crash never leaves a partial file at 'dest'.
     """
-    async for msg in channel.history(limit=None, after=after, before=before, oldest_first=True):
-        yield msg
+    tmp = dest.with_name(dest.name + ".part")
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        async with sem, session.get(att.url) as resp:
+            if resp.status != 429 or attempt == RATE_LIMIT_RETRIES:
+                resp.raise_for_status()
+                try:
+                    async with aiofiles.open(tmp, "wb") as f:
+                        async for chunk in resp.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                            await f.write(chunk)
+                    os.replace(tmp, dest)
+                except BaseException:
+                    tmp.unlink(missing_ok=True)
+                    raise
+                return
+            retry_after = retry_after_seconds(resp.headers.get("Retry-After"))
+
+        # Back off after leaving the request, so neither its pooled connection nor a 'sem' slot is held
+        await asyncio.sleep(retry_after)
 
 
 async def run():
@@ -158,9 +358,11 @@ async def run():
     if end_dt < start_dt:
         raise SystemExit("date-end must be on/after date-start.")
 
-    # Because Discord history() uses exclusive bounds, pad inward to make our [start,end] inclusive
-    after = start_dt - timedelta(seconds=1)
-    before = end_dt + timedelta(seconds=1)
+    # Discord history() uses exclusive bounds; snowflake ids encode creation time, so exact id bounds
+    # make history() return only messages in our inclusive [start,end] window.
+    start_id = discord.utils.time_snowflake(start_dt)
+    after = discord.Object(id=start_id - 1)
+    before = discord.Object(id=discord.utils.time_snowflake(end_dt, high=True) + 1)
 
     # ---- Env vars
     token = os.environ.get("DISCORD_TOKEN")
@@ -175,8 +377,12 @@ async def run():
 
     # ---- Storage setup
     DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    db_init(conn)
+    existing_files = list_existing_files(start_dt, end_dt)
+    # A single connection owned by the manifest writer; the hot path reads from the preloaded sets below
+    write_conn = db_connect(check_same_thread=False, cached_statements=256)
+    db_init(write_conn)
+    seen = db_attachment_ids(write_conn)
+    cursors = db_channel_cursors(write_conn)
 
     # ---- Discord client intents
     intents = discord.Intents.none()
@@ -186,95 +392,173 @@ async def run():
 
     client = discord.Client(intents=intents)
 
+    # One long-lived HTTP session for all CDN downloads (connection pooling, keep-alive, DNS cache)
+    session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=16, ttl_dns_cache=300, keepalive_timeout=60)
+    )
+
     @client.event
     async def on_ready():
         print(f"Logged in as {client.user} (id={client.user.id})")
-        guild = client.get_guild(guild_id)
-        if not guild:
-            print(f"Bot is not in guild {guild_id}.")
-            await client.close()
-            return
-
-        print(f"Scanning guild: {guild.name} ({guild.id})")
-        total_seen = 0
-        total_downloaded = 0
-        total_skipped = 0
-
-        # Iterate text channels the bot can see & read history for
-        channels = [c for c in guild.text_channels if c.permissions_for(guild.me).read_message_history]
-        for ch in channels:
-            print(f" - #{ch.name} ({ch.id})")
-            try:
-                async for msg in bounded_history(ch, after=after, before=before):
-                    total_seen += 1
-                    if not msg.attachments:
-                        continue
-
-                    # Only consider messages created within the exact inclusive window
-                    msg_created_utc = msg.created_at.replace(tzinfo=timezone.utc)
-                    if not (start_dt <= msg_created_utc <= end_dt):
-                        continue
-
-                    for att in msg.attachments:
-                        if not is_media(att):
-                            continue
-
-                        if db_has_attachment(conn, att.id):
-                            total_skipped += 1
+        write_queue: asyncio.Queue = asyncio.Queue()
+        writer = asyncio.create_task(manifest_writer(write_conn, write_queue))
+        try:
+            guild = client.get_guild(guild_id)
+            if not guild:
+                print(f"Bot is not in guild {guild_id}.")
+                return
+
+            print(f"Scanning guild: {guild.name} ({guild.id})")
+            sem = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+
+            def record(msg: discord.Message, att: discord.Attachment, dest: Path, created_at_utc: datetime):
+                write_queue.put_nowait(
+                    (
+                        "row",
+                        manifest_row(
+                            attachment_id=att.id,
+                            message_id=msg.id,
+                            channel_id=msg.channel.id,
+                            guild_id=guild.id,
+                            url=att.url,
+                            filename=dest.relative_to(DOWNLOAD_DIR).as_posix(),
+                            created_at_utc=created_at_utc,
+                        ),
+                    )
+                )
+                seen.add(str(att.id))
+
+            async def download(
+                msg: discord.Message, att: discord.Attachment, dest: Path, created_at_utc: datetime
+            ) -> bool:
+                try:
+                    await save_attachment(session, sem, att, dest)
+                    existing_files.add(dest)
+                    record(msg, att, dest, created_at_utc)
+                    log.info("   saved: %s  (from @%s • %s)", dest.relative_to(DOWNLOAD_DIR).as_posix(), msg.author, msg.created_at.isoformat())
+                    return True
+                except Exception as e:
+                    log.error("   ERROR saving attachment %s from message %s: %s", att.id, msg.id, e)
+                    return False
+
+            async def scan_channel(ch: discord.TextChannel) -> tuple[int, int, int]:
+                """Scan one channel and download its media. Returns (seen, downloaded, skipped)."""
+                log.info(" - #%s (%s)", ch.name, ch.id)
+                n_seen = 0
+                n_skipped = 0
+                pending = []
+                complete = True
+                last_id = None
+
+                # Resume after the last processed message if a previous run already covered our start
+                ch_after = after
+                scanned_from_id = start_id
+                cursor = cursors.get(ch.id)
+                if cursor and cursor[0] <= start_id < cursor[1]:
+                    scanned_from_id = cursor[0]
+                    ch_after = discord.Object(id=cursor[1])
+                    if cursor[1] >= before.id - 1:
+                        # A previous run already covered this whole window; history() could return nothing
+                        write_queue.put_nowait(("commit", None))
+                        return 0, 0, 0
+
+                try:
+                    async for msg in ch.history(limit=None, after=ch_after, before=before, oldest_first=True):
+                        n_seen += 1
+                        last_id = msg.id
+
+                        if not msg.attachments:
                             continue
 
-                        safe_name = compute_filename(msg.author.id, msg.created_at, att.id, att.filename)
-                        dest = DOWNLOAD_DIR / safe_name
-                        if dest.exists():
-                            # If a previous run without DB happened to write this name, mark manifest & skip
-                            db_insert(
-                                conn,
-                                attachment_id=att.id,
-                                message_id=msg.id,
-                                channel_id=ch.id,
-                                guild_id=guild.id,
-                                url=att.url,
-                                filename=str(dest.name),
-                                created_at_utc=msg_created_utc,
-                            )
-                            total_skipped += 1
-                            continue
+                        for att in msg.attachments:
+                            if not is_media(att):
+                                continue
+
+                            if str(att.id) in seen:
+                                n_skipped += 1
+                                continue
+
+                            safe_name = compute_filename(msg.author.id, msg.created_at, att.id, att.filename)
+                            dest = DOWNLOAD_DIR / msg.created_at.strftime(SHARD_FORMAT) / safe_name
+                            if dest in existing_files:
+                                # If a previous run without DB happened to write this name, mark manifest & skip,
+                                # unless its size doesn't match the attachment (a partial download): then refetch.
+                                # A file removed since the startup listing is treated as not present.
+                                try:
+                                    if dest.stat().st_size == att.size:
+                                        record(msg, att, dest, msg.created_at)
+                                        n_skipped += 1
+                                        continue
+                                    dest.unlink()
+                                except FileNotFoundError:
+                                    pass
+                                except OSError as e:
+                                    log.error("   ERROR checking existing file %s: %s", dest, e)
+                                existing_files.discard(dest)
+
+                            pending.append((msg, att, dest, msg.created_at))
+
+                except discord.Forbidden:
+                    complete = False
+                    log.error("   Skipping #%s: missing permissions.", ch.name)
+                except discord.HTTPException as e:
+                    complete = False
+                    log.error("   HTTP error on #%s: %s", ch.name, e)
+
+                # Download whatever was collected, even if history paging failed part way
+                cursor_update = None
+                try:
+                    results = await asyncio.gather(*(download(*job) for job in pending))
+                    # Only advance the cursor when nothing was missed, so failures are retried next run
+                    if complete and all(results) and last_id is not None:
+                        cursor_update = dict(channel_id=ch.id, scanned_from_id=scanned_from_id, last_message_id=last_id)
+                finally:
+                    # Commit this channel's manifest rows together with its cursor
+                    write_queue.put_nowait(("commit", cursor_update))
+                return n_seen, sum(results), n_skipped
+
+            # Scan text channels the bot can see & read history for concurrently;
+            # discord.py rate-limits each channel's history route independently.
+            # Resolve permissions once per channel and skip channels whose history request would 403.
+            me = guild.me
+            channels = []
+            for c in guild.text_channels:
+                perms = c.permissions_for(me)
+                if perms.view_channel and perms.read_message_history:
+                    channels.append(c)
+            results = await asyncio.gather(*(scan_channel(c) for c in channels), return_exceptions=True)
+
+            total_seen = 0
+            total_downloaded = 0
+            total_skipped = 0
+            for ch, result in zip(channels, results):
+                if isinstance(result, BaseException):
+                    log.error("   ERROR scanning #%s: %s", ch.name, result)
+                    continue
+                total_seen += result[0]
+                total_downloaded += result[1]
+                total_skipped += result[2]
+
+            log_buffer.flush()
+            print("\nSummary")
+            print("-------")
+            print(f"Messages scanned:   {total_seen}")
+            print(f"Files downloaded:   {total_downloaded}")
+            print(f"Already downloaded: {total_skipped}")
+        finally:
+            # Let the writer flush pending manifest rows, then close database connection
+            write_queue.put_nowait(("commit", None))
+            await write_queue.join()
+            writer.cancel()
+            await asyncio.to_thread(write_conn.close)
+
+            # Close the Discord client
+            await client.close()
 
-                        try:
-                            await att.save(dest)
-                            db_insert(
-                                conn,
-                                attachment_id=att.id,
-                                message_id=msg.id,
-                                channel_id=ch.id,
-                                guild_id=guild.id,
-                                url=att.url,
-                                filename=str(dest.name),
-                                created_at_utc=msg_created_utc,
-                            )
-                            print(f"   saved: {dest.name}  (from @{msg.author} • {msg.created_utc if hasattr(msg,'created_utc') else msg.created_at.isoformat()})")
-                            total_downloaded += 1
-                        except Exception as e:
-                            print(f"   ERROR saving attachment {att.id} from message {msg.id}: {e}")
-
-            except discord.Forbidden:
-                print(f"   Skipping #{ch.name}: missing permissions.")
-            except discord.HTTPException as e:
-                print(f"   HTTP error on #{ch.name}: {e}")
-
-        print("\nSummary")
-        print("-------")
-        print(f"Messages scanned:   {total_seen}")
-        print(f"Files downloaded:   {total_downloaded}")
-        print(f"Already downloaded: {total_skipped}")
-
-        # Close database connection
-        conn.close()
-
-        # Close the Discord client
-        await client.close()
-
-    await client.start(token)
+    try:
+        await client.start(token)
+    finally:
+        await session.close()
 
 
 if __name__ == "__main__":